@@ -8,14 +8,21 @@
 #   - UI や static ファイル構成は変更しない（/ui, /static/... は既存どおり）。
 
 import os
-import io
 import re
+import sys
+import pickle
+import mmap
 import json
 import base64
+import heapq
 import unicodedata
 import hashlib
+import tempfile
+from array import array
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple
+from functools import lru_cache
+from operator import itemgetter
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Set, Tuple, Union
 
 from fastapi import FastAPI, Query, Request
 from fastapi.responses import (
@@ -25,14 +32,23 @@ from fastapi.responses import (
     PlainTextResponse,
     RedirectResponse,
     Response,
+    StreamingResponse,
 )
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from notion_client import Client  # 添付ファイル用に Notion API を利用
 
+try:
+    import orjson  # 高速 JSON（未インストールなら標準の json で動く）
+except ImportError:  # pragma: no cover
+    orjson = None
+
 # ========= 設定 =========
 
 KB_PATH = os.getenv("KB_PATH", "kb.jsonl")
+# 前処理済み KB（行データ・索引）の保存先。KB の sha256 が同じなら再起動時にパースと索引づくりを省く。
+# 空文字にするとキャッシュを使わない。
+KB_CACHE_PATH = os.getenv("KB_CACHE_PATH", KB_PATH + ".cache.pkl")
 VERSION = os.getenv("APP_VERSION", "jsonl-2025-11-26-file-proxy")
 
 PAGE_SIZE_DEFAULT = 5
@@ -55,9 +71,47 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # ========= KB 状態 =========
 
-KB_ROWS: List[Dict[str, Any]] = []
-KB_LINES: int = 0
-KB_HASH: str = ""
+class KBState:
+    """
+    読み込み済み KB 一式。ensure_kb() は新しく作った KBState を KB へ 1 回の代入で差し替えるだけで、
+    できあがった KBState の中身は書き換えない。検索は最初に KB を 1 回だけ読み、最後までその KBState を使う。
+    """
+
+    __slots__ = ("sha", "lines", "rows", "ngrams", "columns", "sort_base", "sort_shift")
+
+    def __init__(
+        self,
+        sha: str,
+        lines: int,
+        rows: List[Dict[str, Any]],
+        ngrams: Dict[str, array],
+        columns: Dict[str, List[str]],
+        sort_base: List[int],
+        sort_shift: int,
+    ) -> None:
+        self.sha = sha
+        self.lines = lines
+        self.rows = rows
+        # 文字 n-gram（1〜2 文字）→ 行番号（昇順）の転置インデックス
+        self.ngrams = ngrams
+        # 照合用の前処理済み文字列（__ttl_norm など）を項目ごとのリストにしたもの。並びは rows と同じ。
+        # 検索時は行 dict を 1 件ずつ引かず、この列リストを行番号で引いて走査する。
+        self.columns = columns
+        # 行ごとの並び順キーの土台（ヒットフラグ以外の部分）と、ヒットフラグを差し込むビット位置
+        self.sort_base = sort_base
+        self.sort_shift = sort_shift
+
+    # メモ化（lru_cache）のキーに使う。sha256 が同じ KB は中身も同じなので、等しいとみなしてよい。
+    def __hash__(self) -> int:
+        return hash(self.sha)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, KBState) and self.sha == other.sha
+
+
+_EMPTY_KB = KBState("", 0, [], {}, {}, [], 0)
+
+KB: KBState = _EMPTY_KB
 LAST_ERROR: str = ""
 
 # ========= Notion クライアント（添付ファイル用） =========
@@ -83,11 +137,15 @@ def _nfkc(s: Optional[str]) -> str:
 def normalize_text(s: str) -> str:
     if not s:
         return ""
-    s = unicodedata.normalize("NFKC", s)
-    s = s.replace("\u3000", " ")
-    s = re.sub(r"[\r\n\t]+", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    # 全角スペースは NFKC で半角になり、改行・タブも含めて空白類の連続は split() で 1 個にまとまる
+    # （str.split() の空白判定は正規表現の \s と同じ）。前後の空白もここで落ちる。
+    return " ".join(unicodedata.normalize("NFKC", s).split())
+
+
+def _json_loads(s: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        return orjson.loads(s)
+    return json.loads(s)
 
 
 def textify(x: Any) -> str:
@@ -118,18 +176,42 @@ HIRA_SMALL2NORM = {
     "っ": "つ",
     "ゎ": "わ",
 }
+# カタカナ→ひらがな と 小さいかな→通常のかな を 1 枚の表にまとめ、translate 1 回で済ませる。
+# （ァ→ぁ→あ のような 2 段の変換も、ここで合成済み）
+FOLD_TABLE = {
+    **{ord(k): v for k, v in HIRA_SMALL2NORM.items()},
+    **{k: HIRA_SMALL2NORM.get(v, v) for k, v in KATA_TO_HIRA.items()},
+}
 DAKUTEN = "\u3099"
 HANDAKUTEN = "\u309A"
 VOWELS = {"あ", "い", "う", "え", "お"}
 
 
+def _build_diacritics_table() -> Dict[int, Optional[str]]:
+    """
+    濁点・半濁点を外す変換表（が→か、ぱ→は、単独の ゙ ゚ は削除）。
+    NFD で分解して記号を除き NFC に戻す処理を、かなブロックの文字ごとに前計算しておく。
+    （正準分解に濁点・半濁点を含む文字は、このブロックにしか存在しない）
+    """
+    table: Dict[int, Optional[str]] = {ord(DAKUTEN): None, ord(HANDAKUTEN): None}
+    for cp in range(0x3040, 0x3100):
+        nfd = unicodedata.normalize("NFD", chr(cp))
+        if DAKUTEN in nfd or HANDAKUTEN in nfd:
+            base = nfd.replace(DAKUTEN, "").replace(HANDAKUTEN, "")
+            table[cp] = unicodedata.normalize("NFC", base)
+    return table
+
+
+DIACRITICS_TABLE = _build_diacritics_table()
+
+
 def _strip_diacritics(hira: str) -> str:
-    nfkd = unicodedata.normalize("NFD", hira)
-    no_marks = "".join(ch for ch in nfkd if ch not in (DAKUTEN, HANDAKUTEN))
-    return unicodedata.normalize("NFC", no_marks)
+    return hira.translate(DIACRITICS_TABLE)
 
 
 def _long_vowel_to_vowel(hira: str) -> str:
+    if "ー" not in hira:
+        return hira
     out: List[str] = []
     prev = ""
     for ch in hira:
@@ -144,9 +226,11 @@ def _long_vowel_to_vowel(hira: str) -> str:
 def fold_kana(s: str) -> str:
     if not s:
         return ""
+    if s.isascii():
+        # ASCII は NFKC・かな変換・濁点除去のどれでも形が変わらない
+        return s
     t = _nfkc(s)
-    t = t.translate(KATA_TO_HIRA)
-    t = "".join(HIRA_SMALL2NORM.get(ch, ch) for ch in t)
+    t = t.translate(FOLD_TABLE)
     t = _long_vowel_to_vowel(t)
     t = _strip_diacritics(t)
     return t
@@ -173,14 +257,16 @@ URL_KEYS = ["url", "URL", "link", "permalink", "出典URL", "公開URL", "source
 TAG_KEYS = ["tags", "tag", "タグ", "区分", "分類", "カテゴリ", "category", "keywords"]
 
 
+_FIELD_KEY_MAP = {
+    "title": TITLE_KEYS,
+    "text": TEXT_KEYS,
+    "date": DATE_KEYS,
+    "url": URL_KEYS,
+}
+
+
 def record_as_text(rec: Dict[str, Any], field: str) -> str:
-    key_map = {
-        "title": TITLE_KEYS,
-        "text": TEXT_KEYS,
-        "date": DATE_KEYS,
-        "url": URL_KEYS,
-    }
-    keys = key_map.get(field, [field])
+    keys = _FIELD_KEY_MAP.get(field, [field])
     for k in keys:
         v = rec.get(k)
         if v:
@@ -190,7 +276,7 @@ def record_as_text(rec: Dict[str, Any], field: str) -> str:
 
 def record_as_tags(rec: Dict[str, Any]) -> str:
     for k in TAG_KEYS:
-        if k in rec && rec[k]:
+        if k in rec and rec[k]:
             return textify(rec[k])
     return ""
 
@@ -205,6 +291,8 @@ _DATE_RE = re.compile(
     re.UNICODE,
 )
 
+_YEAR_RE = re.compile(r"(?:19|20|21)\d{2}")
+
 _ERA_RE = re.compile(r"(令和|平成|昭和)\s*(\d{1,2})\s*年(?:\s*(\d{1,2})\s*月(?:\s*(\d{1,2})\s*日)?)?")
 
 
@@ -251,49 +339,86 @@ def record_date(rec: Dict[str, Any]) -> Optional[datetime]:
             return dt
 
     # 2) 最後の手段として、本文/タイトル/URL の中の西暦を拾う（年だけ）
-    cand_year: Optional[int] = None
-    for field in ("text", "title", "url"):
-        v = record_as_text(rec, field)
-        for y in re.findall(r"(19\d{2}|20\d{2}|21\d{2})", _nfkc(v)):
-            yy = int(y)
-            cand_year = max(yy, cand_year or 0)
+    #    3 項目を改行でつないで 1 回だけ走査し、最大の年を取る
+    blob = "\n".join(record_as_text(rec, field) for field in ("text", "title", "url"))
+    cand_year = max((int(m.group()) for m in _YEAR_RE.finditer(_nfkc(blob))), default=0)
     if cand_year:
         return datetime(cand_year, 1, 1)
 
     return None
 
 
+def _pub_date(rec: Dict[str, Any]) -> datetime:
+    """
+    記事の日付は「発行日」だけを見る。
+    取れなかった場合は 1900-01-01 を返す（＝最も古い記事として扱う）。
+    """
+    date_text = record_as_text(rec, "date")
+    if date_text:
+        dt = _first_valid_date_from_string(date_text)
+        if dt:
+            return dt
+    return datetime(1900, 1, 1)
+
+
 # ========= KB 読み込み =========
 
-def _compute_lines_and_hash(path: str) -> Tuple[int, str]:
+def _read_kb(path: str, known_sha: str = "") -> Tuple[Optional[List[Dict[str, Any]]], int, str]:
+    """
+    KB ファイルを mmap で 1 回だけ開き、(行データ, 非空行数, sha256) を返す。
+    ハッシュ計算と JSON 読み込みは同じマッピングを使い回す（読み直さない）。
+    sha256 が known_sha と一致したときは読み込みを省き、(None, 0, sha256) を返す。
+    """
+    rows: List[Dict[str, Any]] = []
     cnt = 0
-    sha = hashlib.sha256()
     with open(path, "rb") as f:
-        for line in f:
-            sha.update(line)
-            if line.strip():
+        if os.fstat(f.fileno()).st_size == 0:
+            return rows, 0, hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            sha = hashlib.sha256(mm).hexdigest()
+            if known_sha and sha == known_sha:
+                return None, 0, sha
+            for ln in iter(mm.readline, b""):
+                ln = ln.strip()
+                if not ln:
+                    continue
                 cnt += 1
-    return cnt, sha.hexdigest()
+                try:
+                    rec = _json_loads(ln)
+                except Exception:
+                    continue
+                # JSON として読めてもオブジェクトでない行（null・配列・数値など）は読み飛ばす
+                if isinstance(rec, dict):
+                    rows.append(rec)
+    return rows, cnt, sha
 
 
-def _load_rows(path: str) -> List[Dict[str, Any]]:
-    rows: List[Dict[str, Any]] = []
-    if not os.path.exists(path):
-        return rows
-    with io.open(path, "r", encoding="utf-8") as f:
-        for ln in f:
-            ln = ln.strip()
-            if not ln:
-                continue
-            try:
-                rows.append(json.loads(ln))
-            except Exception:
-                continue
-    return rows
+def _fold_field(norm: str) -> str:
+    """
+    フォールドしても形が変わらない項目は、正規化形と同じオブジェクトをそのまま持たせる。
+    （検索時は「同じオブジェクトなら照合は 1 回で足りる」として 2 回目の走査を省く）
+    """
+    folded = fold_kana(norm)
+    return norm if folded == norm else folded
+
+
+# 著者・区分・出典・日付のような短い値は多くの行で同じ文字列なので、intern して 1 個にまとめる
+_INTERN_MAX_LEN = 64
+
+
+def _intern_short(s: str) -> str:
+    return sys.intern(s) if len(s) <= _INTERN_MAX_LEN else s
+
+
+def _intern_short_values(rec: Dict[str, Any]) -> None:
+    for k, v in rec.items():
+        if isinstance(v, str):
+            rec[k] = _intern_short(v)
 
 
 def _attach_precomputed_fields(rows: List[Dict[str, Any]]) -> None:
     for rec in rows:
+        _intern_short_values(rec)
         title = record_as_text(rec, "title")
         text = record_as_text(rec, "text")
         tags = record_as_tags(rec)
@@ -309,40 +434,353 @@ def _attach_precomputed_fields(rows: List[Dict[str, Any]]) -> None:
             raw = textify(rec)
             txt_norm = normalize_text(raw)
 
+        # 表示用の項目（build_item が毎回キー候補を探さずに済むよう、ここで解決しておく）
+        #   上の保険で使うレコード全体の JSON に入らないよう、textify() の後で足す。
+        rec["__title"] = title
+        rec["__text"] = text
+        rec["__url"] = record_as_text(rec, "url")
+        rec["__date_text"] = record_as_text(rec, "date")
+
         rec["__ttl_norm"] = ttl_norm
         rec["__txt_norm"] = txt_norm
-        rec["__tag_norm"] = tag_norm
+        rec["__tag_norm"] = _intern_short(tag_norm)
 
-        rec["__ttl_fold"] = fold_kana(ttl_norm) if ttl_norm else ""
-        rec["__txt_fold"] = fold_kana(txt_norm[:120000]) if txt_norm else ""
-        rec["__tag_fold"] = fold_kana(tag_norm) if tag_norm else ""
+        rec["__ttl_fold"] = _fold_field(ttl_norm)
+        rec["__txt_fold"] = _fold_field(txt_norm[:120000])
+        rec["__tag_fold"] = _intern_short(_fold_field(rec["__tag_norm"]))
 
         rec["__date_obj"] = record_date(rec)
 
+        # 並べ替え用のキーは毎回の検索で作り直さず、ここで一度だけ計算しておく
+        pub = _pub_date(rec)
+        rec["__pub_key"] = pub.year * 10000 + pub.month * 100 + pub.day
+        rec["__stable_id"] = hashlib.sha256(title.encode("utf-8")).hexdigest()[:16]
+
+
+# ========= 転置インデックス（候補の絞り込み用） =========
+
+# 正規化済み・かなフォールド済みの両方の n-gram を 1 つの索引に入れる。
+# 「nt in norm」「fold(nt) in folded」のどちらでヒットする行も取りこぼさない。
+# キーは 1 文字と 2 文字の部分文字列。1 文字の語（「苔」「桜」など）も索引で絞れる。
+_INDEXED_KEYS = ("__ttl_norm", "__tag_norm", "__txt_norm", "__ttl_fold", "__tag_fold", "__txt_fold")
+
+
+def _bigrams(s: str) -> Set[str]:
+    return {s[i : i + 2] for i in range(len(s) - 1)}
+
+
+def _query_grams(s: str) -> Set[str]:
+    """語を引くときのキー。2 文字以上ならバイグラム、1 文字ならその文字自身。"""
+    return _bigrams(s) if len(s) >= 2 else {s}
+
+
+# 項目をつなぐ区切り文字。normalize_text で空白に置き換わる制御文字なので、
+# 検索語にも項目の中身にも現れず、語が項目の境目をまたいで一致することはない。
+_FIELD_SEP = "\x1f"
+
+
+def _joined_fields(rec: Dict[str, Any], keys: Tuple[str, ...]) -> str:
+    return _FIELD_SEP.join(rec[k] for k in keys)
+
+
+def _build_columns(rows: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    cols = {key: [rec[key] for rec in rows] for key in _INDEXED_KEYS}
+    # タイトル／タグ／本文を 1 本につないだ列（「どこかに含むか」だけを見る除外語の判定用）。
+    # どの項目もフォールドで変わらない行は、フォールド側も同じオブジェクトにしておく。
+    norm_keys = ("__ttl_norm", "__tag_norm", "__txt_norm")
+    fold_keys = ("__ttl_fold", "__tag_fold", "__txt_fold")
+    any_norm: List[str] = []
+    any_fold: List[str] = []
+    for rec in rows:
+        joined = _joined_fields(rec, norm_keys)
+        any_norm.append(joined)
+        if all(rec[f] is rec[n] for n, f in zip(norm_keys, fold_keys)):
+            any_fold.append(joined)
+        else:
+            any_fold.append(_joined_fields(rec, fold_keys))
+    cols["__any_norm"] = any_norm
+    cols["__any_fold"] = any_fold
+    return cols
+
+
+def _build_ngram_index(rows: List[Dict[str, Any]]) -> Dict[str, array]:
+    postings: Dict[str, List[int]] = {}
+    for idx, rec in enumerate(rows):
+        grams: Set[str] = set()
+        for key in _INDEXED_KEYS:
+            text = rec.get(key, "")
+            grams |= _bigrams(text)
+            grams.update(text)
+        for g in grams:
+            postings.setdefault(g, []).append(idx)
+    return {g: array("i", ids) for g, ids in postings.items()}
+
+
+def _rows_with_all_grams(kb: KBState, s: str) -> Set[int]:
+    postings: List[array] = []
+    for g in _query_grams(s):
+        posting = kb.ngrams.get(g)
+        if posting is None:
+            return set()
+        postings.append(posting)
+    # 件数の少ない（珍しい）n-gram から積集合を取る。最初の集合が小さいほど後の絞り込みが軽い。
+    postings.sort(key=len)
+    ids = set(postings[0])
+    for posting in postings[1:]:
+        if not ids:
+            break
+        ids.intersection_update(posting)
+    return ids
+
+
+def _candidate_rows_for_term(kb: KBState, term: str) -> Set[int]:
+    """
+    kb の中で語を含みうる行番号の集合を返す（実際に含むかは後段で判定する）。
+    1 文字の語では集合がほぼ全行になるので、集合そのものはメモ化しない（件数だけ _candidate_count で持つ）。
+    """
+    nt, fn = _term_forms(term)
+    if not nt:
+        return set()
+    out = _rows_with_all_grams(kb, nt)
+    if fn and fn != nt:
+        out |= _rows_with_all_grams(kb, fn)
+    return out
+
+
+@lru_cache(maxsize=4096)
+def _candidate_count(kb: KBState, term: str) -> int:
+    """
+    語の候補行の件数（並べ替え用）。整数だけなのでメモ化しても軽い。
+    キーに kb（＝ sha256）を含めるので、再読み込みの最中に古い KB の検索が書き戻しても
+    新しい KB の検索がそれを引くことはない（古いエントリは ensure_kb() が捨てる）。
+    """
+    return len(_candidate_rows_for_term(kb, term))
+
+
+def _rarest_first(kb: KBState, terms: Sequence[str]) -> List[str]:
+    """重複を除き、候補行の少ない（珍しい）語から並べる。先に絞れるほど後の語の判定が軽い。"""
+    return sorted(dict.fromkeys(terms), key=lambda t: _candidate_count(kb, t))
+
+
+def _candidate_indices(kb: KBState, must_terms: Sequence[str]) -> Optional[List[int]]:
+    """AND 条件の全語について候補を積集合で絞る。AND 語が無ければ None（＝全行が候補）。"""
+    ids: Optional[Set[int]] = None
+    for t in _rarest_first(kb, must_terms):
+        cand = _candidate_rows_for_term(kb, t)
+        if ids is None:
+            ids = cand
+        else:
+            ids &= cand
+        if not ids:
+            break
+    if ids is None:
+        return None
+    return sorted(ids)
+
+
+# ========= 語 × 列（タイトル／タグ／本文）の一括判定 =========
+
+_FIELD_KEYS: Dict[str, Tuple[str, str]] = {
+    "title": ("__ttl_norm", "__ttl_fold"),
+    "tags": ("__tag_norm", "__tag_fold"),
+    "body": ("__txt_norm", "__txt_fold"),
+    # 上の 3 項目を区切り文字でつないだもの（_build_columns 参照）
+    "any": ("__any_norm", "__any_fold"),
+}
+
+
+@lru_cache(maxsize=4096)
+def _term_forms(term: str) -> Tuple[str, str]:
+    """
+    検索語の（正規化形, かなフォールド形）。行ごとではなく語ごとに 1 回だけ計算する。
+    入力はクエリ由来の短い語だけなので、プロセス全体でメモ化しておく。
+    """
+    nt = normalize_text(term)
+    return nt, (fold_kana(nt) if nt else "")
+
+
+def _rows_hit_in_field(kb: KBState, forms: Tuple[str, str], row_ids, field: str) -> Set[int]:
+    """row_ids のうち、kb の field 列に語（正規化形 or フォールド形）を含む行番号。"""
+    nt, fn = forms
+    if not nt:
+        return set()
+    norm_key, fold_key = _FIELD_KEYS[field]
+    norms = kb.columns[norm_key]
+    folds = kb.columns[fold_key]
+    hit = {i for i in row_ids if nt in norms[i]}
+    # フォールド形での照合は、正規化形で見つからなかった行にだけ行う。
+    # ASCII だけの語はフォールドしても形が変わらないので、この段は丸ごと省く。
+    # 語も項目もフォールドで変わらない（fn == nt かつ同一オブジェクト）行は、同じ走査の繰り返しなので省く。
+    if fn and not nt.isascii():
+        same = fn == nt
+        hit.update(
+            i
+            for i in row_ids
+            if i not in hit
+            and not (same and folds[i] is norms[i])
+            and fn in folds[i]
+        )
+    return hit
+
+
+def _rows_hit_in_any_field(kb: KBState, forms: Tuple[str, str], row_ids) -> Set[int]:
+    """row_ids のうち、タイトル／タグ／本文のどこかに語を含む行番号（つないだ列を 1 回ずつ見るだけ）。"""
+    return _rows_hit_in_field(kb, forms, row_ids, "any")
+
+
+# ========= 並び順キー（1 個の整数で比較する） =========
+# 並び順「発行日↓ → タイトル→タグ→本文ヒット → 安定ID」を、上位ビットから
+#   [__pub_key][タイトル][タグ][本文][安定IDの昇順での順位]
+# と詰めた整数 1 個で表す。タプル同士の比較（int / bool / str 混在）をしなくて済む。
+# ヒットフラグ以外はクエリに依らないので、読み込み時に行ごとの土台を作っておく。
+
+_HIT_FLAG_BITS = 3
+
+
+def _build_sort_base(rows: List[Dict[str, Any]]) -> Tuple[List[int], int]:
+    """(行ごとの土台, ヒットフラグを差し込むビット位置) を返す。"""
+    sid_rank = {sid: r for r, sid in enumerate(sorted({rec["__stable_id"] for rec in rows}))}
+    shift = max(len(sid_rank).bit_length(), 1)
+    base = [
+        (rec["__pub_key"] << (_HIT_FLAG_BITS + shift)) | sid_rank[rec["__stable_id"]]
+        for rec in rows
+    ]
+    return base, shift
+
+
+def _set_kb(kb: KBState) -> None:
+    """KB を差し替え、前の KB で作った検索結果と候補件数を捨てる。"""
+    global KB
+    KB = kb
+    _search_bytes.cache_clear()
+    _candidate_count.cache_clear()
+
 
 def ensure_kb() -> None:
-    global KB_ROWS, KB_LINES, KB_HASH, LAST_ERROR
+    global LAST_ERROR
     LAST_ERROR = ""
     if not os.path.exists(KB_PATH):
-        KB_ROWS = []
-        KB_LINES = 0
-        KB_HASH = ""
+        _set_kb(_EMPTY_KB)
         LAST_ERROR = f"kb_not_found:{KB_PATH}"
         return
     try:
-        lines, sha = _compute_lines_and_hash(KB_PATH)
-        rows = _load_rows(KB_PATH)
-        _attach_precomputed_fields(rows)
-        KB_ROWS = rows
-        KB_LINES = lines
-        KB_HASH = sha
+        # 読み込み済みなら今の KB と、まだなら保存済みキャッシュと sha256 を比べる
+        cur = KB
+        known_sha = cur.sha if cur.rows else _read_kb_cache_sha(KB_CACHE_PATH)
+        rows, lines, sha = _read_kb(KB_PATH, known_sha=known_sha)
+        if rows is None and cur.rows:
+            # 中身が前回と同じなら、パース・前処理・索引づくりはやり直さない
+            return
+        kb: Optional[KBState] = None
+        if rows is None:
+            kb = _read_kb_cache(KB_CACHE_PATH, sha)
+            if kb is None:
+                rows, lines, sha = _read_kb(KB_PATH)
+        if kb is None:
+            # キャッシュが無い・使えないときは作り直し、キャッシュも上書きする
+            _attach_precomputed_fields(rows)
+            sort_base, sort_shift = _build_sort_base(rows)
+            state = (lines, rows, _build_ngram_index(rows), _build_columns(rows), sort_base, sort_shift)
+            _write_kb_cache(KB_CACHE_PATH, sha, state)
+            kb = KBState(sha, *state)
+        _set_kb(kb)
     except Exception as e:
-        KB_ROWS = []
-        KB_LINES = 0
-        KB_HASH = ""
+        _set_kb(_EMPTY_KB)
         LAST_ERROR = f"kb_load_failed:{type(e).__name__}:{e}"
 
 
+# ========= 前処理済み KB のキャッシュ（再起動時の読み込み短縮） =========
+# 先頭に「形式番号|アプリの版|app.py のハッシュ:sha256」、続けて ensure_kb() が作る状態一式を pickle で書く。
+# このアプリ自身が書いたファイルだけを読む前提（外から置かれたファイルを読ませないこと）。
+# 前処理の中身を変えたら _KB_CACHE_VERSION を上げて古いキャッシュを無効にする
+# （上げ忘れても、app.py が変われば先頭が一致しなくなるので古い前処理結果は使われない）。
+
+_KB_CACHE_VERSION = 3
+
+
+def _code_fingerprint() -> str:
+    try:
+        with open(__file__, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()[:16]
+    except OSError:
+        return ""
+
+
+_KB_CACHE_TAG = f"{_KB_CACHE_VERSION}|{VERSION}|{_code_fingerprint()}"
+
+
+def _read_kb_cache_sha(path: str) -> str:
+    """キャッシュ先頭の sha256 だけを読む。無い・形式が違う・壊れているときは空文字。"""
+    if not path:
+        return ""
+    try:
+        with open(path, "rb") as f:
+            header = pickle.load(f)
+    except Exception:
+        return ""
+    # アプリの版に ":" が入っていてもよいよう、sha256 は末尾から切り出す
+    tag, _, sha = str(header).rpartition(":")
+    return sha if tag == _KB_CACHE_TAG else ""
+
+
+def _read_kb_cache(path: str, sha: str) -> Optional[KBState]:
+    """
+    キャッシュから KBState を作る。先頭が今の形式・今の KB と一致し、本体の形も合っているときだけ使う。
+    1 つでも合わなければ None（呼び出し側が作り直してキャッシュを上書きする）。
+    """
+    try:
+        with open(path, "rb") as f:
+            if pickle.load(f) != f"{_KB_CACHE_TAG}:{sha}":
+                return None
+            state = pickle.load(f)
+        if not (isinstance(state, tuple) and len(state) == 6):
+            return None
+        lines, rows, ngrams, columns, sort_base, sort_shift = state
+        if not (
+            isinstance(lines, int)
+            and isinstance(rows, list)
+            and isinstance(ngrams, dict)
+            and isinstance(columns, dict)
+            and isinstance(sort_base, list)
+            and isinstance(sort_shift, int)
+            and len(sort_base) == len(rows)
+            and all(
+                isinstance(columns.get(k), list) and len(columns[k]) == len(rows)
+                for keys in _FIELD_KEYS.values()
+                for k in keys
+            )
+        ):
+            return None
+        return KBState(sha, lines, rows, ngrams, columns, sort_base, sort_shift)
+    except Exception:
+        return None
+
+
+def _write_kb_cache(path: str, sha: str, state: Tuple[Any, ...]) -> None:
+    """
+    書けなくても検索には影響しないので、失敗は無視する（一時ファイル経由で置き換える）。
+    一時ファイルは mkstemp で毎回別の名前にする（複数ワーカーが同時に書いても互いに壊さない）。
+    """
+    if not path:
+        return
+    try:
+        fd, tmp = tempfile.mkstemp(
+            prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path) or "."
+        )
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(f"{_KB_CACHE_TAG}:{sha}", f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
 @app.on_event("startup")
 def _startup() -> None:
     ensure_kb()
@@ -350,15 +788,77 @@ def _startup() -> None:
 
 # ========= 共通レスポンス =========
 
-def json_utf8(payload: Dict[str, Any], status: int = 200) -> JSONResponse:
-    return JSONResponse(
+def _json_bytes(content: Any) -> bytes:
+    """UTF-8 の JSON バイト列（orjson があれば使う。無ければ JSONResponse と同じ書式の json）。"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class ORJSONResponse(JSONResponse):
+    """orjson があれば UTF-8 のバイト列へ直接書き出す JSONResponse。"""
+
+    def render(self, content: Any) -> bytes:
+        return _json_bytes(content)
+
+
+def _json_headers(etag: Optional[str]) -> Dict[str, str]:
+    if etag:
+        # ETag を付けるときは保存を許し、毎回 If-None-Match で確認させる
+        return {"Cache-Control": "no-cache", "ETag": etag}
+    return {"Cache-Control": "no-store"}
+
+
+def json_utf8(payload: Dict[str, Any], status: int = 200, etag: Optional[str] = None) -> JSONResponse:
+    return ORJSONResponse(
         payload,
         status_code=status,
         media_type="application/json; charset=utf-8",
-        headers={"Cache-Control": "no-store"},
+        headers=_json_headers(etag),
+    )
+
+
+def json_bytes_utf8(body: bytes, status: int = 200, etag: Optional[str] = None) -> Response:
+    """JSON 化済みのバイト列をそのまま返す（json_utf8 と同じヘッダ）。"""
+    return Response(
+        content=body,
+        status_code=status,
+        media_type="application/json; charset=utf-8",
+        headers=_json_headers(etag),
     )
 
 
+# レスポンスの形や中身の作り方（ハイライト、item の項目など）を変えたら上げる。
+# ETag に入れて、デプロイ前の 304 が使い回されないようにする（APP_VERSION を変えない運用でも効く）。
+_RESPONSE_SCHEMA = 1
+
+
+def _make_etag(basis: str) -> str:
+    """basis にアプリのバージョンとレスポンス形式の番号を足して ETag にする。"""
+    full = f"{VERSION}|{_RESPONSE_SCHEMA}|{basis}"
+    return '"' + hashlib.blake2s(full.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match にこの ETag（弱い比較）が含まれていれば True。"""
+    inm = request.headers.get("if-none-match")
+    if not inm:
+        return False
+    if inm.strip() == "*":
+        return True
+    for tag in inm.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def _not_modified(etag: str, cache_control: str = "no-cache") -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
 # ========= /file 用トークン エンコード・デコード =========
 
 FILE_TOKEN_PREFIX = "f1:"  # 将来仕様変更したときのためのバージョン識別子
@@ -426,11 +926,14 @@ def _html_page(title: str, inner: str) -> HTMLResponse:
 
 @app.get("/health")
 def health(request: Request):
+    kb = KB
     payload = {
-        "ok": bool(KB_ROWS),
+        "ok": bool(kb.rows),
         "kb_path": KB_PATH,
-        "kb_size": KB_LINES,
-        "kb_fingerprint": KB_HASH,
+        "kb_size": kb.lines,
+        # JSON として読めずに読み飛ばした行の数（kb_size は空行を除いた全行数）
+        "kb_skipped_lines": kb.lines - len(kb.rows),
+        "kb_fingerprint": kb.sha,
         "last_error": LAST_ERROR,
         "version": VERSION,
     }
@@ -450,12 +953,12 @@ def version(request: Request):
 @app.get("/admin/refresh")
 def admin_refresh():
     ensure_kb()
-    ok = bool(KB_ROWS)
+    kb = KB
     return json_utf8(
         {
-            "ok": ok,
-            "kb_size": KB_LINES,
-            "kb_fingerprint": KB_HASH,
+            "ok": bool(kb.rows),
+            "kb_size": kb.lines,
+            "kb_fingerprint": kb.sha,
             "last_error": LAST_ERROR,
         }
     )
@@ -474,10 +977,19 @@ def get_sw():
 
 
 @app.get("/ui")
-def ui():
+def ui(request: Request):
     path = os.path.join("static", "ui.html")
     if os.path.exists(path):
-        return FileResponse(path, media_type="text/html; charset=utf-8")
+        # 更新時刻とサイズから ETag を作り、変わっていなければ本文を送らない
+        st = os.stat(path)
+        etag = _make_etag(f"{st.st_mtime_ns}-{st.st_size}")
+        if _etag_matches(request, etag):
+            return _not_modified(etag)
+        return FileResponse(
+            path,
+            media_type="text/html; charset=utf-8",
+            headers={"ETag": etag, "Cache-Control": "no-cache"},
+        )
     return PlainTextResponse("static/ui.html not found", status_code=404)
 
 
@@ -537,7 +1049,16 @@ def file_proxy(fid: str = Query(..., description="添付ファイルID（/api/se
 
 RANGE_SEP = r"(?:-|–|—|~|〜|～|\.{2})"
 
+# 末尾の年範囲／単年を 1 回の照合で拾う正規表現（モジュール読み込み時に 1 度だけコンパイルする）
+#   年範囲は単年より必ず手前から始まるので、先頭側を最短一致にすれば範囲のほうが優先される。
+_YEAR_TAIL_RE = re.compile(
+    rf"^(?P<head>.*?)"
+    rf"(?:(?P<y1>(?:19|20|21)\d{{2}})\s*{RANGE_SEP}\s*(?P<y2>(?:19|20|21)\d{{2}})|(?P<y>(?:19|20|21)\d{{2}}))"
+    rf"\s*$"
+)
+
 
+@lru_cache(maxsize=512)
 def _parse_year_from_query(q_raw: str) -> Tuple[str, Optional[int], Optional[Tuple[int, int]]]:
     """
     クエリ末尾の「西暦4桁」または「西暦4桁-西暦4桁」を年フィルタとして解釈する。
@@ -547,6 +1068,8 @@ def _parse_year_from_query(q_raw: str) -> Tuple[str, Optional[int], Optional[Tup
       - コンテスト2024
       - 剪定 1999-2001
       - 剪定1999-2001
+
+    同じクエリが繰り返し来ることが多いので、結果は lru_cache で使い回す（戻り値は不変）。
     """
     q = _nfkc(q_raw or "").strip()
     if not q:
@@ -555,34 +1078,34 @@ def _parse_year_from_query(q_raw: str) -> Tuple[str, Optional[int], Optional[Tup
     # 全角スペース → 半角スペース
     q = q.replace("　", " ")
 
-    # 1) 「… 2023-2024」や「…2023-2024」を末尾から拾う（年範囲）
-    rng_pattern = rf"^(?P<head>.*?)(?P<y1>(?:19|20|21)\d{{2}})\s*{RANGE_SEP}\s*(?P<y2>(?:19|20|21)\d{{2}})\s*$"
-    m_rng = re.search(rng_pattern, q)
-    if m_rng:
-        head = (m_rng.group("head") or "").strip()
-        y1 = int(m_rng.group("y1"))
-        y2 = int(m_rng.group("y2"))
+    m = _YEAR_TAIL_RE.search(q)
+
+    # 1) 年指定なし（そのままクエリとして使う）
+    if not m:
+        return q, None, None
+
+    base = (m.group("head") or "").strip()
+
+    # 2) 「… 2023-2024」や「…2023-2024」（年範囲）
+    if m.group("y1") is not None:
+        y1 = int(m.group("y1"))
+        y2 = int(m.group("y2"))
         lo, hi = (y1, y2) if y1 <= y2 else (y2, y1)
-        base = head
         return base, None, (lo, hi)
 
-    # 2) 「… 2024」や「…2024」を末尾から拾う（単年）
-    year_pattern = r"^(?P<head>.*?)(?P<y>(?:19|20|21)\d{2})\s*$"
-    m_year = re.search(year_pattern, q)
-    if m_year:
-        head = (m_year.group("head") or "").strip()
-        y = int(m_year.group("y"))
-        base = head
-        return base, y, None
-
-    # 3) 年指定なし（そのままクエリとして使う）
-    return q, None, None
+    # 3) 「… 2024」や「…2024」（単年）
+    return base, int(m.group("y")), None
 
 
 TOKEN_RE = re.compile(r'"([^"]+)"|(\S+)')
 
 
-def parse_query(q: str) -> Tuple[List[str], List[str], List[str]]:
+@lru_cache(maxsize=512)
+def parse_query(q: str) -> Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]:
+    """
+    クエリを AND 語／除外語／全トークンに分ける。
+    結果をキャッシュで共有するため、各リストはタプルにして返す。
+    """
     must: List[str] = []
     minus: List[str] = []
     raw: List[str] = []
@@ -595,7 +1118,7 @@ def parse_query(q: str) -> Tuple[List[str], List[str], List[str]]:
             minus.append(tok[1:])
         else:
             must.append(tok)
-    return must, minus, raw
+    return tuple(must), tuple(minus), tuple(raw)
 
 
 def _matches_year(rec: Dict[str, Any], year: Optional[int], year_range: Optional[Tuple[int, int]]) -> bool:
@@ -628,30 +1151,45 @@ def html_escape(s: str) -> str:
     return (s or "").replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
 
-def highlight_simple(text: str, terms: List[str]) -> str:
+@lru_cache(maxsize=512)
+def _compile_highlight(esc_terms: Tuple[str, ...]) -> "re.Pattern[str]":
+    return re.compile("|".join(re.escape(t) for t in esc_terms))
+
+
+def highlight_pattern(terms: Sequence[str]) -> Optional["re.Pattern[str]"]:
+    """
+    ハイライト用の正規表現（正規化・重複除去した語を長い順に並べた 1 本の選択）。
+    1 リクエストにつき 1 回だけ作る。語がなければ None。
+    """
+    norm_terms = (_term_forms(t)[0] for t in terms)
+    esc_terms = dict.fromkeys(html_escape(t) for t in norm_terms if t)
+    if not esc_terms:
+        return None
+    # 長い語を先に試すので、短い語が長い語の一部だけを奪うことはない
+    return _compile_highlight(tuple(sorted(esc_terms, key=len, reverse=True)))
+
+
+def highlight_simple(text: str, hl_re: Optional["re.Pattern[str]"]) -> str:
+    """
+    hl_re は highlight_pattern() で用意したもの。
+    全語を 1 回の置換で <mark> するので、挿入済みの <mark> を後の語が壊すことはない。
+    """
     if not text:
         return ""
     esc = html_escape(text)
-    if not terms:
+    if hl_re is None:
         return esc
-
-    norm_terms = [normalize_text(t) for t in terms if normalize_text(t)]
-    norm_terms = sorted(set(norm_terms), key=len, reverse=True)
-
-    for t in norm_terms:
-        pattern = re.escape(html_escape(t))
-        esc = re.sub(pattern, lambda m: f"<mark>{m.group(0)}</mark>", esc)
-    return esc
+    return hl_re.sub(r"<mark>\g<0></mark>", esc)
 
 
 def build_item(
     rec: Dict[str, Any],
-    terms: List[str],
+    hl_re: Optional["re.Pattern[str]"],
     is_first_in_page: bool,
     matches: Optional[Dict[str, List[str]]] = None,
 ) -> Dict[str, Any]:
-    title = record_as_text(rec, "title") or "(無題)"
-    body = record_as_text(rec, "text") or ""
+    title = rec["__title"] or "(無題)"
+    body = rec["__text"]
 
     if is_first_in_page:
         if len(body) <= FIRST_SNIPPET_LEN:
@@ -665,10 +1203,10 @@ def build_item(
             snippet_src = body[:OTHER_SNIPPET_LEN] + "…"
 
     item: Dict[str, Any] = {
-        "title": highlight_simple(title, terms),
-        "content": highlight_simple(snippet_src, terms),
-        "url": record_as_text(rec, "url"),
-        "date": record_as_text(rec, "date"),
+        "title": highlight_simple(title, hl_re),
+        "content": highlight_simple(snippet_src, hl_re),
+        "url": rec["__url"],
+        "date": rec["__date_text"],
         "rank": None,
     }
     if matches:
@@ -676,7 +1214,7 @@ def build_item(
     return item
 
 
-def _calc_matches_for_debug(rec: Dict[str, Any], terms: List[str]) -> Dict[str, List[str]]:
+def _calc_matches_for_debug(rec: Dict[str, Any], terms: Sequence[str]) -> Dict[str, List[str]]:
     ttl = rec.get("__ttl_norm", "")
     txt = rec.get("__txt_norm", "")
     tag = rec.get("__tag_norm", "")
@@ -684,7 +1222,7 @@ def _calc_matches_for_debug(rec: Dict[str, Any], terms: List[str]) -> Dict[str,
     hit_tag: List[str] = []
     hit_txt: List[str] = []
     for t in terms:
-        nt = normalize_text(t)
+        nt = _term_forms(t)[0]
         if not nt:
             continue
         if nt in ttl:
@@ -728,29 +1266,30 @@ def build_files_payload(rec: Dict[str, Any]) -> List[Dict[str, str]]:
 
 
 # ========= /api/search 本体 =========
-@app.get("/api/search")
-def api_search(
-    q: str = Query("", description="検索クエリ（-語=除外、末尾年/範囲はフィルタ）"),
-    page: int = Query(1, ge=1),
-    page_size: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=50),
-    order: str = Query("latest", description="latest 固定（互換用）"),
-    debug: int = Query(0, description="1でヒット内訳を返す（診断用）"),
-):
+
+def _empty_search_payload(page: int, page_size: int, error: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "items": [],
+        "total_hits": 0,
+        "page": page,
+        "page_size": page_size,
+        "has_more": False,
+        "next_page": None,
+        "error": error,
+        "order_used": "latest",
+    }
+
+
+def _search(kb: KBState, q: str, page: int, page_size: int, debug: int) -> Tuple[Dict[str, Any], int]:
+    """
+    検索本体。(レスポンス本体, ステータス) を返す。
+    kb は呼び出し側で KB を 1 回だけ読んだもの（途中で再読み込みされても、この検索は同じ KB だけを見る）。
+    ヒットがあるときの payload["items"] は、ページ分の item を順に作るイテレータ
+    （/api/search は list にまとめて返し、/api/search_stream は 1 件ずつ書き出す）。
+    """
     # KB が読めていないとき
-    if not KB_ROWS:
-        return json_utf8(
-            {
-                "items": [],
-                "total_hits": 0,
-                "page": page,
-                "page_size": page_size,
-                "has_more": False,
-                "next_page": None,
-                "error": "kb_not_loaded",
-                "order_used": "latest",
-            },
-            status=503,
-        )
+    if not kb.rows:
+        return _empty_search_payload(page, page_size, "kb_not_loaded"), 503
 
     # クエリ解析（年フィルタ付き）
     base_q, year, year_range = _parse_year_from_query(q)
@@ -758,197 +1297,134 @@ def api_search(
 
     # 何も指定がないときは空
     if not must_terms and not minus_terms:
-        return json_utf8(
-            {
-                "items": [],
-                "total_hits": 0,
-                "page": page,
-                "page_size": page_size,
-                "has_more": False,
-                "next_page": None,
-                "error": None,
-                "order_used": "latest",
-            }
-        )
+        return _empty_search_payload(page, page_size), 200
 
     # -------------------------
     # 1. 年フィルタ（発行日だけを見る）
     # -------------------------
-    def _pub_date_for_rec(rec: Dict[str, Any]) -> datetime:
-        """
-        記事の日付は「発行日」だけを見る。
-        取れなかった場合は 1900-01-01 を返す（＝最も古い記事として扱う）。
-        """
-        date_text = record_as_text(rec, "date")
-        if date_text:
-            dt = _first_valid_date_from_string(date_text)
-            if dt:
-                return dt
-        return datetime(1900, 1, 1)
-
-    candidates: List[Dict[str, Any]] = []
-    for rec in KB_ROWS:
-        dt = _pub_date_for_rec(rec)
-        rec["_pub_date_for_sort"] = dt  # 後でソートに使う
-
-        # 年フィルタがある場合は発行年だけで判定
-        if year is not None or year_range is not None:
-            y = dt.year
-            if year is not None:
-                if y != year:
-                    continue
-            if year_range is not None:
-                lo, hi = year_range
-                if not (lo <= y <= hi):
-                    continue
-
-        candidates.append(rec)
+    # n-gram 索引で AND 語をすべて含みうる行だけに絞ってから走査する
+    rows = kb.rows
+    cand_idx = _candidate_indices(kb, must_terms)
+    row_ids = range(len(rows)) if cand_idx is None else cand_idx
+
+    # 年フィルタがある場合は発行年だけで判定する。
+    #   発行日は読み込み時に yyyymmdd の整数（__pub_key）にしてあるので、
+    #   単年も範囲も「下限〜上限の整数比較」1 回で済む。
+    if year is not None:
+        year_range = (year, year)
+    if year_range is None:
+        candidates: List[int] = list(row_ids)
+    else:
+        key_lo = year_range[0] * 10000
+        key_hi = year_range[1] * 10000 + 9999
+        candidates = [i for i in row_ids if key_lo <= rows[i]["__pub_key"] <= key_hi]
 
     if not candidates:
-        return json_utf8(
-            {
-                "items": [],
-                "total_hits": 0,
-                "page": page,
-                "page_size": page_size,
-                "has_more": False,
-                "next_page": None,
-                "error": None,
-                "order_used": "latest",
-            }
-        )
+        return _empty_search_payload(page, page_size), 200
 
     # -------------------------
     # 2. AND／除外語フィルタ
+    #   語ごとに候補行の列（タイトル／タグ／本文）をまとめて判定する。
     # -------------------------
-    filtered: List[Dict[str, Any]] = []
-
-    def _contains_in_field(term: str, norm: str, folded: str) -> bool:
-        nt = normalize_text(term)
-        if not nt:
-            return False
-        if nt in norm:
-            return True
-        fn = fold_kana(nt)
-        if fn and fn in folded:
-            return True
-        return False
-
-    for rec in candidates:
-        ttl = rec.get("__ttl_norm", "")
-        txt = rec.get("__txt_norm", "")
-        tag = rec.get("__tag_norm", "")
-        fttl = rec.get("__ttl_fold", "")
-        ftxt = rec.get("__txt_fold", "")
-        ftag = rec.get("__tag_fold", "")
-
-        # 除外語：タイトル／タグ／本文のどこかに入っていたら除外
-        exclude = False
-        for t in minus_terms:
-            if (
-                _contains_in_field(t, ttl, fttl)
-                or _contains_in_field(t, tag, ftag)
-                or _contains_in_field(t, txt, ftxt)
-            ):
-                exclude = True
-                break
-        if exclude:
-            continue
-
-        # AND 条件：must_terms のすべてが、タイトル／タグ／本文のどこかに入っている
-        ok = True
-        for t in must_terms:
-            if not (
-                _contains_in_field(t, ttl, fttl)
-                or _contains_in_field(t, tag, ftag)
-                or _contains_in_field(t, txt, ftxt)
-            ):
-                ok = False
-                break
-        if not ok:
-            continue
-
-        # 同じ発行日の中での優先順位用フラグ
-        terms_for_flags = must_terms or raw_terms
-        has_title_hit = any(_contains_in_field(t, ttl, fttl) for t in terms_for_flags)
-        has_tag_hit = any(_contains_in_field(t, tag, ftag) for t in terms_for_flags)
-        has_body_hit = any(_contains_in_field(t, txt, ftxt) for t in terms_for_flags)
-
-        rec["_has_title_hit"] = has_title_hit
-        rec["_has_tag_hit"] = has_tag_hit
-        rec["_has_body_hit"] = has_body_hit
-
-        filtered.append(rec)
-
-    if not filtered:
-        return json_utf8(
-            {
-                "items": [],
-                "total_hits": 0,
-                "page": page,
-                "page_size": page_size,
-                "has_more": False,
-                "next_page": None,
-                "error": None,
-                "order_used": "latest",
-            }
-        )
+    kept: Set[int] = set(candidates)
+
+    # 除外語：タイトル／タグ／本文のどこかに入っていたら除外
+    #   n-gram 索引で除外語を含みうる行だけを走査する（索引に無い行は確実に含まない）。
+    for t in minus_terms:
+        kept -= _rows_hit_in_any_field(kb, _term_forms(t), kept & _candidate_rows_for_term(kb, t))
+        if not kept:
+            break
+
+    # AND 条件：must_terms のすべてが、タイトル／タグ／本文のどこかに入っている
+    #   列ごとのヒット集合は、後段の優先順位フラグにもそのまま使う（再走査しない）。
+    title_hits: Set[int] = set()
+    tag_hits: Set[int] = set()
+    body_hits: Set[int] = set()
+    #   語は候補の少ない順に見る（kept が早く縮むほど、後の語で走査する行が減る）。
+    for t in _rarest_first(kb, must_terms):
+        if not kept:
+            break
+        forms = _term_forms(t)
+        in_title = _rows_hit_in_field(kb, forms, kept, "title")
+        in_tags = _rows_hit_in_field(kb, forms, kept, "tags")
+        in_body = _rows_hit_in_field(kb, forms, kept, "body")
+        title_hits |= in_title
+        tag_hits |= in_tags
+        body_hits |= in_body
+        kept = in_title | in_tags | in_body
+
+    if not kept:
+        return _empty_search_payload(page, page_size), 200
+
+    # 同じ発行日の中での優先順位用フラグ
+    #   must_terms があれば上の AND 判定で集め済み。除外語だけのクエリのときだけ raw_terms で判定する。
+    if not must_terms:
+        for t in raw_terms:
+            forms = _term_forms(t)
+            title_hits |= _rows_hit_in_field(kb, forms, kept, "title")
+            tag_hits |= _rows_hit_in_field(kb, forms, kept, "tags")
+            body_hits |= _rows_hit_in_field(kb, forms, kept, "body")
 
     # -------------------------
     # 3. ソート
     #   1) 発行日（新しい順）
     #   2) 同じ日付の中では「タイトル→タグ→本文」の順
     # -------------------------
-    scored: List[Tuple[datetime, bool, bool, bool, str, Dict[str, Any]]] = []
+    # 絞り込み結果は別リストにせず、候補順のまま (並び順キー, 行番号) を 1 件ずつ作って流し込む。
+    # 並び順キーは読み込み時の土台にヒットフラグ 3 ビットを差し込んだ整数（_build_sort_base 参照）。
     terms_for_debug = must_terms or raw_terms
-
-    for rec in filtered:
-        dt = rec.get("_pub_date_for_sort") or datetime(1900, 1, 1)
-        has_title_hit = bool(rec.get("_has_title_hit"))
-        has_tag_hit = bool(rec.get("_has_tag_hit"))
-        has_body_hit = bool(rec.get("_has_body_hit"))
-
-        # 安定ソート用ID（タイトルから作る）
-        stable_id = hashlib.sha256(
-            (record_as_text(rec, "title") or "").encode("utf-8")
-        ).hexdigest()[:16]
-
-        scored.append((dt, has_title_hit, has_tag_hit, has_body_hit, stable_id, rec))
+    sort_base = kb.sort_base
+    shift = kb.sort_shift
+    scored: Iterator[Tuple[int, int]] = (
+        (
+            sort_base[i]
+            | (((i in title_hits) << 2 | (i in tag_hits) << 1 | (i in body_hits)) << shift),
+            i,
+        )
+        for i in candidates
+        if i in kept
+    )
 
     # 発行日↓ → タイトルヒット→タグヒット→本文ヒット→安定ID
-    scored.sort(
-        key=lambda x: (x[0], x[1], x[2], x[3], x[4]),
-        reverse=True,
-    )
+    # 返すのは 1 ページ分だけなので、全件ソートせず上位 end 件だけを選ぶ
+    # （heapq.nlargest は sorted(..., reverse=True)[:end] と同じ並びになる）。
+    # kept は candidates の部分集合なので、ヒット件数は len(kept) で分かる。
+    # 上位 end 件だけを持つヒープへ直接流すので、全ヒット分のタプルを並べたリストは作らない。
+    total = len(kept)
+    start = (page - 1) * page_size
+    end = start + page_size
+    sort_key = itemgetter(0)
+    if end < total:
+        ranked = heapq.nlargest(end, scored, key=sort_key)
+    else:
+        ranked = sorted(scored, key=sort_key, reverse=True)
 
     # -------------------------
     # 4. ページング＆レスポンス
     # -------------------------
-    total = len(scored)
-    start = (page - 1) * page_size
-    end = start + page_size
-    page_slice = scored[start:end]
+    page_slice = ranked[start:end]
     has_more = end < total
     next_page = page + 1 if has_more else None
 
-    items: List[Dict[str, Any]] = []
-    for idx, (dt, has_title_hit, has_tag_hit, has_body_hit, stable_id, rec) in enumerate(
-        page_slice, start=start + 1
-    ):
-        matches = _calc_matches_for_debug(rec, terms_for_debug) if debug == 1 else None
-        item = build_item(
-            rec,
-            terms_for_debug,
-            is_first_in_page=(idx == start + 1),
-            matches=matches,
-        )
-        item["rank"] = idx
-        # 添付ファイル情報（UI 用）
-        item["files"] = build_files_payload(rec)
-        items.append(item)
+    hl_re = highlight_pattern(terms_for_debug)
+
+    def _items() -> Iterator[Dict[str, Any]]:
+        for idx, (_, row_id) in enumerate(page_slice, start=start + 1):
+            rec = rows[row_id]
+            matches = _calc_matches_for_debug(rec, terms_for_debug) if debug == 1 else None
+            item = build_item(
+                rec,
+                hl_re,
+                is_first_in_page=(idx == start + 1),
+                matches=matches,
+            )
+            item["rank"] = idx
+            # 添付ファイル情報（UI 用）
+            item["files"] = build_files_payload(rec)
+            yield item
 
     payload = {
-        "items": items,
+        "items": _items(),
         "total_hits": total,
         "page": page,
         "page_size": page_size,
@@ -957,7 +1433,91 @@ def api_search(
         "error": None,
         "order_used": "latest",
     }
-    return json_utf8(payload)
+    return payload, 200
+
+
+def _stream_payload(payload: Dict[str, Any]) -> Iterator[bytes]:
+    """payload を /api/search と同じ JSON として、items を 1 件ずつ書き出す。"""
+    yield b'{"items":['
+    for n, item in enumerate(payload["items"]):
+        if n:
+            yield b","
+        yield _json_bytes(item)
+    rest = {k: v for k, v in payload.items() if k != "items"}
+    # rest は空にならないので、先頭の "{" を落として items の後ろへつなげる
+    yield b"]," + _json_bytes(rest)[1:]
+
+
+def _stream_ndjson(payload: Dict[str, Any]) -> Iterator[bytes]:
+    """1 行目に items 以外の項目、2 行目以降に item を 1 行 1 件で書き出す（NDJSON）。"""
+    yield _json_bytes({k: v for k, v in payload.items() if k != "items"}) + b"\n"
+    for item in payload["items"]:
+        yield _json_bytes(item) + b"\n"
+
+
+@lru_cache(maxsize=128)
+def _search_bytes(kb: KBState, q: str, page: int, page_size: int, debug: int) -> bytes:
+    """
+    /api/search の JSON バイト列（ステータス 200）。同じ KB・同じ条件なら結果は変わらないので、
+    JSON 化まで済ませたものをメモ化する。
+    読み込み済みの kb でだけ呼ぶこと（KB 未読み込みの 503 はキャッシュに入れない）。
+    1 件で数十 KB になるページもあるので、持つ件数は少なめにしておく。
+    """
+    payload, _ = _search(kb, q, page, page_size, debug)
+    payload["items"] = list(payload["items"])
+    return _json_bytes(payload)
+
+
+def _search_etag(kb: KBState, q: str, page: int, page_size: int, order: str, debug: int) -> str:
+    """検索結果は KB の中身・パラメータ・アプリの版だけで決まるので、それらから ETag を作る。"""
+    return _make_etag(f"{kb.sha}|{q}|{page}|{page_size}|{order}|{debug}")
+
+
+@app.get("/api/search")
+def api_search(
+    request: Request,
+    q: str = Query("", description="検索クエリ（-語=除外、末尾年/範囲はフィルタ）"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=50),
+    order: str = Query("latest", description="latest 固定（互換用）"),
+    debug: int = Query(0, description="1でヒット内訳を返す（診断用）"),
+):
+    kb = KB
+    if not kb.rows:
+        return json_utf8(_empty_search_payload(page, page_size, "kb_not_loaded"), status=503)
+
+    # 同じ KB・同じ条件で取り直されたときは、検索も JSON 化もせず 304 を返す
+    etag = _search_etag(kb, q, page, page_size, order, debug)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+
+    return json_bytes_utf8(_search_bytes(kb, q, page, page_size, debug), etag=etag)
+
+
+@app.get("/api/search_stream")
+def api_search_stream(
+    q: str = Query("", description="検索クエリ（-語=除外、末尾年/範囲はフィルタ）"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=50),
+    order: str = Query("latest", description="latest 固定（互換用）"),
+    debug: int = Query(0, description="1でヒット内訳を返す（診断用）"),
+    fmt: str = Query("json", alias="format", description="json（/api/search と同じ形）または ndjson（1 行目がメタ情報、以降 1 行 1 件）"),
+):
+    """
+    /api/search と同じ内容を、item ができた順に書き出す（先頭の結果が早く届く）。
+    ジェネレータは同期のままにして、ハイライトなどの CPU 処理はスレッドプール側で回す。
+    """
+    payload, status = _search(KB, q, page, page_size, debug)
+    if fmt == "ndjson":
+        body, media_type = _stream_ndjson(payload), "application/x-ndjson; charset=utf-8"
+    else:
+        body, media_type = _stream_payload(payload), "application/json; charset=utf-8"
+    return StreamingResponse(
+        body,
+        status_code=status,
+        media_type=media_type,
+        headers={"Cache-Control": "no-store"},
+    )
 
 
 # ========= エントリポイント（ローカル実行用） =========